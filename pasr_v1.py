@@ -23,38 +23,44 @@ import mrcfile
 import numpy as np
 import argparse
 import os
+from contextlib import ExitStack
 from tifffile import imread, imwrite
 
-def scale_image(image, scale):
-    return np.repeat(np.repeat(image, scale, axis=1), scale, axis=0)
+def scale_image(image, scale, out=None):
+    *lead, H, W = image.shape
+    if out is None:
+        out = np.empty((*lead, H*scale, W*scale), dtype=image.dtype)
+    out.reshape(*lead, H, scale, W, scale)[...] = image[..., :, None, :, None]
+    return out
 
 def process_stack(input_file, output_file, scale):
-    if input_file.endswith('.mrc') or input_file.endswith('.mrcs'):
-        # Open the MRC stack file
-        with mrcfile.open(input_file) as mrc:
+    with ExitStack() as stack:
+        if input_file.endswith('.mrc') or input_file.endswith('.mrcs'):
+            # Memory-map the MRC stack file (read it in full if it is about to be overwritten)
+            if os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+                mrc = stack.enter_context(mrcfile.open(input_file, permissive=True))
+            else:
+                mrc = stack.enter_context(mrcfile.mmap(input_file, mode='r', permissive=True))
             original_data = mrc.data
-    elif input_file.endswith('.tif') or input_file.endswith('.tiff'):
-        # Read the TIFF stack file
-        original_data = imread(input_file)
-    else:
-        raise ValueError('Unsupported file format')
+        elif input_file.endswith('.tif') or input_file.endswith('.tiff'):
+            # Read the TIFF stack file
+            original_data = imread(input_file)
+        else:
+            raise ValueError('Unsupported file format')
 
-    # PASR pre-process each frame
-    processed_data = np.empty((original_data.shape[0], original_data.shape[1]*scale, original_data.shape[2]*scale), dtype=original_data.dtype)
-
-    for i in range(original_data.shape[0]):
-        processed_data[i] = scale_image(original_data[i], scale)
-
-    # Write the data to a new file
-    if output_file.endswith('.mrc') or output_file.endswith('.mrcs'):
-        # Write the MRC stack file
-        with mrcfile.new(output_file, overwrite=True) as mrc:
-            mrc.set_data(processed_data)
-    elif output_file.endswith('.tif') or output_file.endswith('.tiff'):
-        # Write the TIFF stack file
-        imwrite(output_file, processed_data, compression='lzw')
-    else:
-        raise ValueError('Unsupported file format')
+        # PASR pre-process each frame and write the data to a new file
+        if output_file.endswith('.mrc') or output_file.endswith('.mrcs'):
+            # Write the MRC stack file, scaling straight into the memory-mapped output
+            N, H, W = original_data.shape
+            mrc_mode = mrcfile.utils.mode_from_dtype(original_data.dtype)
+            with mrcfile.new_mmap(output_file, (N, H*scale, W*scale), mrc_mode=mrc_mode, overwrite=True) as mrc:
+                scale_image(original_data, scale, out=mrc.data)
+                mrc.update_header_stats()
+        elif output_file.endswith('.tif') or output_file.endswith('.tiff'):
+            # Write the TIFF stack file
+            imwrite(output_file, scale_image(original_data, scale), compression='lzw')
+        else:
+            raise ValueError('Unsupported file format')
 
     print('PASR pre-processed data written to', output_file)
 
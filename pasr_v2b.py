@@ -8,9 +8,12 @@
 # Recommended install:
 # conda create env --name pasr python=3.11
 # conda activate pasr
-# pip install termcolor mrcfile tifffile imagecodecs pillow
+# pip install termcolor mrcfile tifffile imagecodecs pillow numba
 # python3 pasr_v2b.py -h
 #
+# numba is optional; without it the slower pure NumPy upscale is used.
+# cupy is optional too, and only needed for --gpu (pip install cupy-cuda12x).
+#
 # Version history:
 # Version 2 Python implementation
 # - fix single frame processing crash
@@ -34,23 +37,323 @@ import numpy as np
 from PIL import Image
 from termcolor import colored
 from tifffile import imread, imwrite
-from multiprocessing import Pool
+from imagecodecs import jpeg8_encode
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import ExitStack
+try:
+    from numba import njit, prange, set_num_threads, config as numba_config
+except ImportError:
+    njit = None
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+# Numba kernels for the upscale, one pair per scale factor so the scale is a compile-time
+# constant and the inner replica loop can be fully unrolled and vectorised. Only the first
+# replica of each output row is written pixel by pixel; the other S-1 replicas are whole-row
+# copies, which compile down to wide memcpy-style stores.
+def _make_upscale_kernels(S):
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def upscale2d(src, dst):
+        for i in prange(src.shape[0]):
+            first = dst[i*S]
+            for j in range(src.shape[1]):
+                v = src[i, j]
+                for dj in range(S):
+                    first[j*S+dj] = v
+            for di in range(1, S):
+                dst[i*S+di, :] = first
+
+    # Parallel over all N*H source rows rather than frames, as a chunk of large frames
+    # may hold fewer frames than there are threads
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def upscale3d(src, dst):
+        H = src.shape[1]
+        for k in prange(src.shape[0] * H):
+            n = k // H
+            i = k - n*H
+            first = dst[n, i*S]
+            for j in range(src.shape[2]):
+                v = src[n, i, j]
+                for dj in range(S):
+                    first[j*S+dj] = v
+            for di in range(1, S):
+                dst[n, i*S+di, :] = first
+
+    return upscale2d, upscale3d
+
+# Scale factor -> (2D kernel, 3D kernel), matching the --scale choices. Kernels compile
+# lazily on first use for each dtype, and are then loaded from numba's on-disk cache.
+_KERNELS = {s: _make_upscale_kernels(s) for s in (2, 3, 4)} if njit is not None else {}
+
+# CUDA kernel for the upscale: one thread per output pixel, reading its source pixel.
+# Adjacent threads write adjacent output pixels, so the stores are coalesced.
+if cp is not None:
+    _gpu_upscale = cp.ElementwiseKernel(
+        'raw S src, int64 H, int64 W, int64 s', 'D dst',
+        '''
+        long long x = i % (W * s);
+        long long y = (i / (W * s)) % (H * s);
+        long long n = i / (W * s * H * s);
+        dst = src[(n * H + y / s) * W + x / s];
+        ''',
+        'pasr_upscale')
+
+def gpu_available():
+    """Checks whether CuPy is installed and can see a CUDA device.
+
+    Returns:
+    bool, whether --gpu can be used
+    """
+    if cp is None:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except cp.cuda.runtime.CUDARuntimeError:
+        return False
+
+# Scaled frame stacks are streamed to TIF output in chunks of about this many bytes
+CHUNK_BYTES = 1 << 30
+
+def _use_kernel(image, out, scale):
+    # numba only handles native byte order and has no float16 (MRC mode 12) support.
+    # Mismatched dtypes (e.g. uint8 widened for MRC output) take the casting NumPy path.
+    return (scale in _KERNELS and image.dtype.isnative and image.dtype != np.float16
+            and out.dtype == image.dtype)
+
+def _upscale_gpu(src, dst, s):
+    # Upload, scale and download a chunk of frames at a time to bound GPU memory use
+    H, W = src.shape[-2:]
+    frames, out_frames = src.reshape(-1, H, W), dst.reshape(-1, H*s, W*s)
+    chunk = max(1, CHUNK_BYTES // (H*s * W*s * dst.dtype.itemsize))
+    for lo in range(0, frames.shape[0], chunk):
+        # CuPy needs native byte order (MRC files can be big-endian)
+        src_gpu = cp.asarray(np.ascontiguousarray(frames[lo:lo+chunk], dtype=frames.dtype.newbyteorder('=')))
+        dst_gpu = cp.empty((src_gpu.shape[0], H*s, W*s), dtype=dst.dtype.newbyteorder('='))
+        _gpu_upscale(src_gpu, H, W, s, dst_gpu)
+        out_chunk = out_frames[lo:lo+chunk]
+        if out_chunk.dtype == dst_gpu.dtype and out_chunk.flags.c_contiguous:
+            # Download straight into the destination (e.g. the MRC memory map or a streaming
+            # buffer) rather than into a host temporary that is then copied again
+            dst_gpu.get(out=out_chunk)
+        else:
+            out_chunk[...] = dst_gpu.get()
+
+def _upscale_numpy(src, dst, s):
+    # Separable upscale: duplicate columns into a row buffer, then copy each buffered row
+    # s times. Both passes are contiguous stores, which beats a single strided 5D broadcast.
+    H, W = src.shape[-2:]
+    row_buf = np.empty((H, W*s), dtype=src.dtype)
+    for frame, out in zip(src.reshape(-1, H, W), dst.reshape(-1, H*s, W*s)):
+        row_buf.reshape(H, W, s)[...] = frame[:, :, None]
+        out.reshape(H, s, W*s)[...] = row_buf[:, None, :]
 
 # Function to scale image
-def scale_image(image, scale):
-    """Scales an image by duplicating each pixel.
+def scale_image(image, scale, n_cores=1, out=None, gpu=False):
+    """Scales an image, or every frame of a stack, by duplicating each pixel.
+
+    Args:
+    image : numpy array representing the image (H, W) or frame stack (N, H, W)
+    scale : int, scale factor
+    n_cores : int, number of threads for the NumPy path
+    out : numpy array to write the scaled result into, allocated if None
+    gpu : bool, whether to scale on the GPU (check gpu_available() first)
+
+    Returns:
+    numpy array, the scaled image or frame stack
+    """
+    *lead, H, W = image.shape
+    if out is None:
+        out = np.empty((*lead, H*scale, W*scale), dtype=image.dtype)
+    if gpu:
+        _upscale_gpu(image, out, scale)
+    elif not _use_kernel(image, out, scale):
+        if n_cores > 1:
+            # NumPy releases the GIL for the bulk copy, so blocks of frames scale with threads,
+            # or blocks of rows when there are fewer frames than threads.
+            # The numba kernels are already parallel (and must not be called concurrently).
+            frames, out_frames = image.reshape(-1, H, W), out.reshape(-1, H*scale, W*scale)
+            if frames.shape[0] >= n_cores:
+                bounds = np.linspace(0, frames.shape[0], n_cores + 1).astype(int)
+                blocks = [(frames[lo:hi], out_frames[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+            else:
+                bounds = np.linspace(0, H, min(n_cores, H) + 1).astype(int)
+                blocks = [(frames[:, lo:hi], out_frames[:, lo*scale:hi*scale]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+            with ThreadPoolExecutor(max_workers=n_cores) as ex:
+                futures = [ex.submit(_upscale_numpy, src, dst, scale) for src, dst in blocks]
+                for future in futures:
+                    future.result()
+        else:
+            _upscale_numpy(image, out, scale)
+    else:
+        upscale2d, upscale3d = _KERNELS[scale]
+        if image.ndim == 3:
+            upscale3d(image, out)
+        else:
+            upscale2d(image, out)
+    return out
+
+# Function to convert an image for 8-bit output
+def to_uint8(image):
+    """Rescales an image's min-max range to 0-255 for 8-bit output.
+
+    A plain cast would wrap 16-bit values and truncate floats. uint8 images
+    are returned unchanged, and complex images are rescaled by magnitude.
 
     Args:
     image : numpy array representing the image
+
+    Returns:
+    numpy array of uint8, the rescaled image
+    """
+    if image.dtype == np.uint8:
+        return image
+    if np.iscomplexobj(image):
+        image = np.abs(image)
+    lo, hi = image.min(), image.max()
+    rescaled = image.astype(np.float32)
+    rescaled -= lo
+    if hi > lo:
+        rescaled *= 255 / (float(hi) - float(lo))
+    return np.rint(rescaled, out=rescaled).astype(np.uint8)
+
+# Function to stream a scaled frame stack
+def scaled_frames(stack, scale, n_cores=1, gpu=False):
+    """Yields the scaled frames of a stack, scaling one chunk of frames at a time.
+
+    The next chunk is scaled on a background thread while the current one is
+    consumed, so reading (e.g. paging in a memory-mapped MRC) and scaling overlap
+    with writing. Each chunk gets a fresh buffer rather than reusing one, as the
+    consumer may keep views of earlier frames: tifffile's multithreaded encoder
+    gathers strips across frames before compressing them.
+
+    Args:
+    stack : numpy array representing the frame stack (N, H, W)
     scale : int, scale factor
+    n_cores : int, number of threads for the NumPy path
+    gpu : bool, whether to scale on the GPU
+
+    Yields:
+    numpy array, each scaled frame
+    """
+    N, H, W = stack.shape
+    chunk = max(1, min(N, CHUNK_BYTES // (H*scale * W*scale * stack.dtype.itemsize)))
+
+    def scale_chunk(lo):
+        return scale_image(stack[lo:lo+chunk], scale, n_cores, gpu=gpu)
+
+    # The first chunk is scaled on the calling thread, so the kernel compiles and numba's
+    # threading layer starts there: TBB deadlocks at exit if first launched from a worker thread
+    current = scale_chunk(0)
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        for lo in range(chunk, N, chunk):
+            pending = ex.submit(scale_chunk, lo)
+            yield from current
+            current = pending.result()
+        yield from current
+
+# Function to choose TIF writer options
+def tif_write_options(shape, dtype, compression, n_cores=1):
+    """Builds the tifffile write options for the scaled output.
+
+    Strips are compressed on n_cores threads. BigTIFF is used only when the
+    uncompressed data could overflow classic TIFF's 4 GB offsets, since tifffile
+    doesn't decide this itself for compressed output.
+
+    Args:
+    shape : tuple, shape of the scaled output
+    dtype : numpy dtype of the scaled output
+    compression : str, compression method
+    n_cores : int, number of compression threads
 
     Returns:
-    numpy array, the scaled image
+    dict, keyword arguments for imwrite
     """
-    return np.repeat(np.repeat(image, scale, axis=1), scale, axis=0)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+    return {
+        'bigtiff': nbytes > 2**32 - 2**25,
+        'compression': compression,
+        'compressionargs': {'level': 1} if compression == 'zstd' else None,
+        'maxworkers': n_cores,
+    }
+
+# Readers, called with the ExitStack that keeps the input open while it is scaled
+def _read_mrc(input_file, output_file, stack):
+    # MRC input is memory-mapped so frames are paged in as they are scaled, unless
+    # the output overwrites it, in which case it is read into memory first
+    if os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+        mrc = stack.enter_context(mrcfile.open(input_file, permissive=True))
+    else:
+        mrc = stack.enter_context(mrcfile.mmap(input_file, mode='r', permissive=True))
+    return mrc.data
+
+def _read_tif(input_file, output_file, stack):
+    return imread(input_file)
+
+def _read_jpg(input_file, output_file, stack):
+    # tifffile can't decode JPG. Colour JPGs are converted to greyscale, as a (H, W, 3)
+    # array would otherwise be processed as a stack of H frames
+    with Image.open(input_file) as im:
+        return np.asarray(im.convert('L'))
+
+def _set_header_stats(header, data):
+    # Equivalent to mrcfile's update_header_stats() on the scaled output. Pixel duplication
+    # leaves min, max, mean and rms unchanged, so they are taken from the input instead of
+    # reading the s*s times larger output back in from disk.
+    if data.size == 0:
+        return
+    if np.iscomplexobj(data):
+        header.rms = np.float32(data.std().real)
+    else:
+        header.dmin = np.float32(data.min())
+        header.dmax = np.float32(data.max())
+        header.dmean = data.mean(dtype=np.float32)
+        header.rms = data.std(dtype=np.float32)
+
+# Writers, which scale the data as they write it
+def _write_mrc(output_file, data, scale, compression, flip_tif, n_cores, gpu, jpg_quality):
+    # Scale straight into a memory-mapped output file rather than holding it in RAM
+    *lead, H, W = data.shape
+    mrc_mode = mrcfile.utils.mode_from_dtype(data.dtype)
+    with mrcfile.new_mmap(output_file, (*lead, H*scale, W*scale), mrc_mode=mrc_mode, overwrite=True) as mrc:
+        scale_image(data, scale, n_cores, out=mrc.data, gpu=gpu)
+        _set_header_stats(mrc.header, data)
+    print(colored(f'PASR pre-processed data written to {output_file}. No compression applied for MRC format (use TIF for compression).\n', 'green'))
+
+def _write_tif(output_file, data, scale, compression, flip_tif, n_cores, gpu, jpg_quality):
+    # Flipping the input with a reversed view is free, and equivalent to flipping the
+    # scaled output along the same axis, so no flipped copy is ever made
+    source = data[::-1] if flip_tif else data
+    *lead, H, W = source.shape
+    tif_options = tif_write_options((*lead, H*scale, W*scale), source.dtype, compression, n_cores)
+    if source.ndim == 3:
+        # Stream frame stacks to the writer chunk by chunk rather than scaling them whole
+        frames = scaled_frames(source, scale, n_cores, gpu)
+        imwrite(output_file, frames, shape=(*lead, H*scale, W*scale), dtype=source.dtype, photometric='minisblack', **tif_options)
+    else:
+        imwrite(output_file, scale_image(source, scale, n_cores, gpu=gpu), **tif_options)
+    flip_status = "Flipping applied." if flip_tif else "No flipping applied."
+    print(colored(f'PASR pre-processed data written to {output_file} with {compression} compression. {flip_status}\n', 'green'))
+
+def _write_jpg(output_file, data, scale, compression, flip_tif, n_cores, gpu, jpg_quality):
+    if data.ndim == 3:
+        print(colored('Error: Cannot save 2D frame stack as JPG.', 'red'))
+        return
+    # Normalising before scaling touches each source pixel once rather than s*s times
+    processed_data = scale_image(to_uint8(data), scale, n_cores, gpu=gpu)
+    # Encode with libjpeg-turbo directly instead of going through a PIL image
+    with open(output_file, 'wb') as f:
+        f.write(jpeg8_encode(processed_data, level=jpg_quality))
+    print(colored(f'PASR pre-processed data written to {output_file}\n', 'green'))
+
+# File format dispatch, keyed on the lowercased file extension
+_READERS = {'.mrc': _read_mrc, '.mrcs': _read_mrc, '.tif': _read_tif, '.tiff': _read_tif, '.jpg': _read_jpg}
+_WRITERS = {'.mrc': _write_mrc, '.mrcs': _write_mrc, '.tif': _write_tif, '.tiff': _write_tif, '.jpg': _write_jpg}
 
 # Function to process each file
-def process_file(input_file, output_file, scale, compression, flip_tif):
+def process_file(input_file, output_file, scale, compression, flip_tif, n_cores=1, gpu=False, jpg_quality=75):
     """Processes a file: reads, scales and writes it.
 
     Args:
@@ -59,55 +362,37 @@ def process_file(input_file, output_file, scale, compression, flip_tif):
     scale : int, scale factor
     compression : str, compression method
     flip_tif : bool, whether to flip the image
+    n_cores : int, number of CPU cores to use within the file
+    gpu : bool, whether to scale on the GPU
+    jpg_quality : int, JPG quality (1-100)
 
     Returns:
     None
     """
-    # Reading the file
-    if input_file.endswith('.mrc') or input_file.endswith('.mrcs'):
-        with mrcfile.open(input_file) as mrc:
-            original_data = mrc.data
-    elif input_file.endswith('.tif') or input_file.endswith('.tiff') or input_file.endswith('.jpg'):
-        original_data = imread(input_file)
-    else:
+    reader = _READERS.get(os.path.splitext(input_file)[1].lower())
+    if reader is None:
         raise ValueError(colored('Unsupported input file format. Only MRC, TIF and JPG files are supported.', 'red'))
-
-    # Scaling the image
-    if original_data.ndim == 3:
-        processed_data = np.empty((original_data.shape[0], original_data.shape[1]*scale, original_data.shape[2]*scale), dtype=original_data.dtype)
-        for i in range(original_data.shape[0]):
-            processed_data[i] = scale_image(original_data[i], scale)
-    elif original_data.ndim == 2:
-        processed_data = scale_image(original_data, scale)
-    else:
-        raise ValueError(colored('Unsupported data dimensions. Only 2D images and 2D frame stacks are supported.', 'red'))
-
-    # Writing the output
-    if output_file.endswith('.mrc') or output_file.endswith('.mrcs'):
-        with mrcfile.new(output_file, overwrite=True) as mrc:
-            mrc.set_data(processed_data)
-        print(colored(f'PASR pre-processed data written to {output_file}. No compression applied for MRC format (use TIF for compression).\n', 'green'))
-    elif output_file.endswith('.tif') or output_file.endswith('.tiff'):
-        if flip_tif:
-            processed_data = np.flip(processed_data, axis=0)
-            flip_status = "Flipping applied."
-        else:
-            flip_status = "No flipping applied."
-        imwrite(output_file, processed_data, compression=compression)
-        print(colored(f'PASR pre-processed data written to {output_file} with {compression} compression. {flip_status}\n', 'green'))
-    elif output_file.endswith('.jpg'):
-        if original_data.ndim == 3:
-            print(colored('Error: Cannot save 2D frame stack as JPG.', 'red'))
-            return
-        processed_data = processed_data.astype(np.uint8)
-        im = Image.fromarray(processed_data)
-        im.save(output_file)
-        print(colored(f'PASR pre-processed data written to {output_file}\n', 'green'))
-    else:
+    writer = _WRITERS.get(os.path.splitext(output_file)[1].lower())
+    if writer is None:
         raise ValueError(colored('Unsupported output file format. Only MRC, TIF, and JPG for 2D images are supported.', 'red'))
 
+    with ExitStack() as stack:
+        original_data = reader(input_file, output_file, stack)
+        if original_data.ndim not in (2, 3):
+            raise ValueError(colored('Unsupported data dimensions. Only 2D images and 2D frame stacks are supported.', 'red'))
+        writer(output_file, original_data, scale, compression, flip_tif, n_cores, gpu, jpg_quality)
+    if gpu:
+        # CuPy's memory pool keeps freed chunk buffers; hand them back to the device between files
+        cp.get_default_memory_pool().free_all_blocks()
+
+def _set_numba_threads(n_threads):
+    # Caps the numba kernels' thread count to honour -n. Also the process pool initializer,
+    # so n_cores directory workers don't each start n_cores threads.
+    if njit is not None:
+        set_num_threads(min(n_threads, numba_config.NUMBA_NUM_THREADS))
+
 # Function to process a directory
-def process_directory(input_dir, output_dir, scale, compression, flip_tif, force_tif, force_mrc, force_jpg, n_cores, keep_basename):
+def process_directory(input_dir, output_dir, scale, compression, flip_tif, force_tif, force_mrc, force_jpg, n_cores, keep_basename, gpu=False, jpg_quality=75):
     """Processes a directory: lists all files and processes each of them.
 
     Args:
@@ -121,12 +406,16 @@ def process_directory(input_dir, output_dir, scale, compression, flip_tif, force
     force_jpg : bool, whether to force JPG output
     n_cores : int, number of CPU cores to use
     keep_basename : bool, whether to keep the original file basename
+    gpu : bool, whether to scale on the GPU
+    jpg_quality : int, JPG quality (1-100)
 
     Returns:
     None
     """
-    # Listing all files in the directory
-    file_list = glob.glob(os.path.join(input_dir, "*"))
+    # Listing the supported files in the directory, largest first so the biggest stacks
+    # start early and smaller files fill in around them (longest processing time first)
+    file_list = [f for f in glob.glob(os.path.join(input_dir, "*")) if os.path.splitext(f)[1].lower() in _READERS and os.path.isfile(f)]
+    file_list.sort(key=os.path.getsize, reverse=True)
     # Creating the output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -145,12 +434,39 @@ def process_directory(input_dir, output_dir, scale, compression, flip_tif, force
         else:
             output_file = os.path.join(output_dir, f"{base_name}_PASR_{scale}x{ext}")
         if flip_tif is None:
-            flip_tif = input_file.lower().endswith(('.mrc', '.mrcs')) and output_file.lower().endswith(('.tif', '.tiff'))
-        arguments.append((input_file, output_file, scale, compression, flip_tif))
+            file_flip_tif = input_file.lower().endswith(('.mrc', '.mrcs')) and output_file.lower().endswith(('.tif', '.tiff'))
+        else:
+            file_flip_tif = flip_tif
+        arguments.append((input_file, output_file, scale, compression, file_flip_tif))
+    if not arguments:
+        return
+
+    # Using a process pool to process all files in parallel. With fewer files than cores,
+    # the spare cores are shared out as threads within each file. On the GPU, files are
+    # processed one at a time, as each worker would hold its own CUDA context and ~1 GiB
+    # chunk buffers on the same device.
+    n_workers = 1 if gpu else min(n_cores, len(arguments))
+    n_threads = max(1, n_cores // n_workers)
+    arguments = [(*a, n_threads, gpu, jpg_quality) for a in arguments]
+    # Spawn rather than fork, as forking after numba has compiled a parallel kernel hangs the pool.
+    # Workers take files in submission order as they free up, so the size ordering is kept.
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context('spawn'), initializer=_set_numba_threads, initargs=(n_threads,)) as ex:
+        list(ex.map(process_file, *zip(*arguments)))
+
+# Function to validate the JPG quality argument
+def jpg_quality(value):
+    """Parses a JPG quality, which must be an integer from 1 to 100.
+
+    Args:
+    value : str, command line value
 
-    # Using a multiprocessing pool to process all files in parallel
-    with Pool(n_cores) as p:
-        p.starmap(process_file, arguments)
+    Returns:
+    int, the JPG quality
+    """
+    quality = int(value)
+    if not 1 <= quality <= 100:
+        raise argparse.ArgumentTypeError(f'{value} is not between 1 and 100')
+    return quality
 
 if __name__ == "__main__":
     # Parsing command line arguments
@@ -158,15 +474,21 @@ if __name__ == "__main__":
     parser.add_argument("input", type=str, help="Input MRC, MRCS, TIF, TIFF, or JPG file, or directory containing such files.")
     parser.add_argument("-s", "--scale", type=int, choices=range(2, 5), default=2, help="Scaling factor (number of times to duplicate each pixel)")
     parser.add_argument("-o", "--output", type=str, help="Output MRC, TIF, or TIFF file, or directory to store processed files.")
-    parser.add_argument("-c", "--compression", type=str, choices=['zlib', 'lzw'], default='lzw', help="Compression algorithm for TIF output.")
+    parser.add_argument("-c", "--compression", type=str, choices=['zlib', 'lzw', 'zstd'], default='lzw', help="Compression algorithm for TIF output. zstd is much faster, but not every TIF reader supports it.")
     parser.add_argument("-n", "--n_cores", type=int, default=os.cpu_count(), help="Number of CPU cores to use for parallel processing.")
     parser.add_argument("-k", "--keep_basename", action="store_true", help="Keep the original basename for the output file(s); do not append _PASR_{scale}x.")
     parser.add_argument("--flip_tif", default=None, action='store_true', help="Option to flip TIF output across the x-axis. Default is True for MRC/MRCS input and TIF/TIFF output, False otherwise, unless specified.")
-    parser.add_argument("--force_tif", action="store_true", help="Force the output file extension to be .tif. This is useful because .tif output uses ZLIB or LZW compression.")
+    parser.add_argument("--force_tif", action="store_true", help="Force the output file extension to be .tif. This is useful because .tif output uses ZLIB, LZW or ZSTD compression.")
     parser.add_argument("--force_mrc", action="store_true", help="Force the output file extension to be .mrc. This exists just for completion.")
     parser.add_argument("--force_jpg", action="store_true", help="Force the output file extension to be .jpg for 2D images. This exists just for fun.")
+    parser.add_argument("-q", "--jpg_quality", type=jpg_quality, default=75, metavar="{1-100}", help="Quality for JPG output.")
+    parser.add_argument("--gpu", action="store_true", help="Scale on a CUDA GPU using CuPy. Directories are then processed one file at a time. Falls back to the CPU if CuPy or a GPU is not available.")
     args = parser.parse_args()
 
+    if args.gpu and not gpu_available():
+        print(colored('Warning: --gpu requested, but CuPy or a CUDA GPU is not available. Using the CPU instead.', 'yellow'))
+        args.gpu = False
+
     # Checking if the input is a directory
     if os.path.isdir(args.input):
         # If the output path is not specified or it's a file, raise an error
@@ -179,7 +501,7 @@ if __name__ == "__main__":
             if confirm.lower() != 'y':
                 exit()
 
-        process_directory(args.input, args.output, args.scale, args.compression, args.flip_tif, args.force_tif, args.force_mrc, args.force_jpg, args.n_cores, args.keep_basename)
+        process_directory(args.input, args.output, args.scale, args.compression, args.flip_tif, args.force_tif, args.force_mrc, args.force_jpg, args.n_cores, args.keep_basename, args.gpu, args.jpg_quality)
     else:
         # If the output file is not specified, we create one with the same name as the input, but append "_PASR" before the extension
         if args.output is None:
@@ -210,5 +532,6 @@ if __name__ == "__main__":
             if confirm.lower() != 'y':
                 exit()
 
-        process_file(args.input, args.output, args.scale, args.compression, args.flip_tif)
+        _set_numba_threads(args.n_cores)
+        process_file(args.input, args.output, args.scale, args.compression, args.flip_tif, args.n_cores, args.gpu, args.jpg_quality)
 
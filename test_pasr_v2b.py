@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import mrcfile
+import numpy as np
+import pytest
+from tifffile import imread
+
+import pasr_v2b
+
+
+def reference(data, scale):
+    return np.repeat(np.repeat(data, scale, axis=-1), scale, axis=-2)
+
+
+@pytest.mark.parametrize("compression", ["lzw", "zlib", "zstd"])
+@pytest.mark.parametrize("n_cores", [1, 2, 4])
+@pytest.mark.parametrize("chunk_frames", [1, 5, 10])
+def test_tif_stack_round_trip_multi_chunk(tmp_path, monkeypatch, compression, n_cores, chunk_frames):
+    # Few frames per chunk so the 37-frame stack streams through many chunks, with
+    # n_cores > 1 also running tifffile's multithreaded encoder
+    data = np.random.default_rng(0).integers(0, 4000, (37, 48, 40)).astype(np.uint16)
+    scale = 3
+    monkeypatch.setattr(pasr_v2b, "CHUNK_BYTES", chunk_frames * 48*scale * 40*scale * data.itemsize)
+    input_file, output_file = str(tmp_path / "stack.mrc"), str(tmp_path / "stack.tif")
+    with mrcfile.new(input_file) as mrc:
+        mrc.set_data(data)
+
+    pasr_v2b.process_file(input_file, output_file, scale, compression, True, n_cores)
+
+    np.testing.assert_array_equal(imread(output_file), reference(data, scale)[::-1])
+
+
+@pytest.mark.parametrize("kernels", [True, False])
+@pytest.mark.parametrize("shape", [(1, 37, 41), (3, 37, 41), (9, 37, 41), (37, 41)])
+def test_scale_image_few_frames(monkeypatch, kernels, shape):
+    # Chunks of large frames hold fewer frames than threads, so work is split by rows
+    if not kernels:
+        monkeypatch.setattr(pasr_v2b, "_KERNELS", {})
+    data = np.random.default_rng(0).integers(0, 4000, shape).astype(np.uint16)
+
+    out = pasr_v2b.scale_image(data, 3, n_cores=4)
+
+    np.testing.assert_array_equal(out, reference(data, 3))
+
+
+class FakeDeviceArray(np.ndarray):
+    # Host-backed stand-in for a CuPy array, recording how results are downloaded
+    downloads = []
+
+    def get(self, out=None):
+        FakeDeviceArray.downloads.append("out" if out is not None else "copy")
+        if out is None:
+            return np.array(self)
+        out[...] = self
+        return out
+
+
+def fake_gpu_upscale(src, H, W, s, dst):
+    # Same indexing as the CUDA kernel, one output pixel per element
+    i = np.arange(dst.size)
+    x, y, n = i % (W*s), (i // (W*s)) % (H*s), i // (W*s * H*s)
+    dst.reshape(-1)[:] = src.reshape(-1)[(n*H + y//s)*W + x//s]
+
+
+@pytest.fixture
+def fake_cupy(monkeypatch):
+    uploads = []
+
+    def asarray(a):
+        uploads.append(a.shape[0])
+        return np.array(a).view(FakeDeviceArray)
+
+    def empty(shape, dtype):
+        return np.empty(shape, dtype).view(FakeDeviceArray)
+
+    def get_default_memory_pool():
+        return SimpleNamespace(free_all_blocks=lambda: uploads.append("free"))
+
+    monkeypatch.setattr(pasr_v2b, "cp", SimpleNamespace(asarray=asarray, empty=empty, get_default_memory_pool=get_default_memory_pool))
+    monkeypatch.setattr(pasr_v2b, "_gpu_upscale", fake_gpu_upscale, raising=False)
+    monkeypatch.setattr(FakeDeviceArray, "downloads", [])
+    return uploads
+
+
+@pytest.mark.parametrize("dtype, download", [("<u2", "out"), (">u2", "copy"), ("<f4", "out")])
+def test_upscale_gpu_chunks(fake_cupy, monkeypatch, dtype, download):
+    # 7 frames in chunks of 3, downloaded straight into the output unless it isn't native
+    data = np.random.default_rng(0).integers(0, 4000, (7, 5, 6)).astype(dtype)
+    scale = 2
+    monkeypatch.setattr(pasr_v2b, "CHUNK_BYTES", 3 * 5*scale * 6*scale * data.itemsize)
+
+    out = pasr_v2b.scale_image(data, scale, gpu=True)
+
+    np.testing.assert_array_equal(out, reference(data, scale))
+    assert fake_cupy == [3, 3, 1]
+    assert FakeDeviceArray.downloads == [download] * 3
+
+
+class InProcessPool:
+    # Stands in for the spawned process pool, recording its size
+    max_workers = []
+
+    def __init__(self, max_workers, **kwargs):
+        InProcessPool.max_workers.append(max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+def test_gpu_directory_one_worker(fake_cupy, monkeypatch, tmp_path):
+    # One worker drives the GPU, freeing CuPy's memory pool after each file
+    monkeypatch.setattr(pasr_v2b, "ProcessPoolExecutor", InProcessPool)
+    monkeypatch.setattr(InProcessPool, "max_workers", [])
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    data = np.arange(3 * 4 * 5, dtype=np.uint16).reshape(3, 4, 5)
+    for name in ("a", "b"):
+        with mrcfile.new(str(input_dir / f"{name}.mrc")) as mrc:
+            mrc.set_data(data)
+
+    pasr_v2b.process_directory(str(input_dir), str(output_dir), 2, "lzw", False, False, False, False, 8, False, gpu=True)
+
+    assert InProcessPool.max_workers == [1]
+    assert fake_cupy == [3, "free", 3, "free"]
+    for name in ("a", "b"):
+        with mrcfile.open(str(output_dir / f"{name}_PASR_2x.mrc")) as mrc:
+            np.testing.assert_array_equal(mrc.data, reference(data, 2))